@@ -4,134 +4,125 @@ Convert a Jupyter notebook with SageMath code to an HTML page with embedded Sage
 This script processes markdown (with TeX) and code cells, creating an interactive HTML page.
 """
 
-import nbformat
 import sys
 import os
 import re
+import json
+import glob
+import hashlib
+import shutil
+from concurrent.futures import ProcessPoolExecutor
 
-def markdown_to_html(markdown_text):
-    """
-    Convert markdown to HTML while preserving LaTeX math.
-    This is a simple converter that handles common markdown elements.
-    """
-    html = markdown_text
-    
-    # Convert headers
-    html = re.sub(r'^######\s+(.+)$', r'<h6>\1</h6>', html, flags=re.MULTILINE)
-    html = re.sub(r'^#####\s+(.+)$', r'<h5>\1</h5>', html, flags=re.MULTILINE)
-    html = re.sub(r'^####\s+(.+)$', r'<h4>\1</h4>', html, flags=re.MULTILINE)
-    html = re.sub(r'^###\s+(.+)$', r'<h3>\1</h3>', html, flags=re.MULTILINE)
-    html = re.sub(r'^##\s+(.+)$', r'<h2>\1</h2>', html, flags=re.MULTILINE)
-    html = re.sub(r'^#\s+(.+)$', r'<h1>\1</h1>', html, flags=re.MULTILINE)
-    
-    # Convert bold and italic (but not in LaTeX)
-    # Use negative lookbehind/lookahead to avoid matching $ signs
-    html = re.sub(r'\*\*(.+?)\*\*', r'<strong>\1</strong>', html)
-    html = re.sub(r'\*(.+?)\*', r'<em>\1</em>', html)
-    # Also support underscore-based italics
-    html = re.sub(r'\b_(.+?)_\b', r'<em>\1</em>', html)
-    
-    # Convert inline code (but preserve LaTeX)
-    html = re.sub(r'`([^`]+)`', r'<code>\1</code>', html)
-    
-    # Convert lists
-    lines = html.split('\n')
-    in_list = False
-    result_lines = []
-    
-    for line in lines:
-        # Ordered list
-        if re.match(r'^\d+\.\s+', line):
-            if in_list != 'ol':
-                if in_list:
-                    result_lines.append(f'</{in_list}>')
-                result_lines.append('<ol class="indented-list">')
-                in_list = 'ol'
-            item = re.sub(r'^\d+\.\s+', '', line)
-            result_lines.append(f'<li>{item}</li>')
-        # Unordered list
-        elif re.match(r'^[-*]\s+', line):
-            if in_list != 'ul':
-                if in_list:
-                    result_lines.append(f'</{in_list}>')
-                result_lines.append('<ul class="indented-list">')
-                in_list = 'ul'
-            item = re.sub(r'^[-*]\s+', '', line)
-            result_lines.append(f'<li>{item}</li>')
-        else:
-            if in_list:
-                result_lines.append(f'</{in_list}>')
-                in_list = False
-            result_lines.append(line)
-    
-    if in_list:
-        result_lines.append(f'</{in_list}>')
-    
-    html = '\n'.join(result_lines)
-    
-    # Convert paragraphs (lines separated by blank lines)
-    # Split by double newlines, but preserve display math blocks
-    paragraphs = re.split(r'\n\s*\n', html)
-    formatted_paragraphs = []
-    
-    for para in paragraphs:
-        para = para.strip()
-        if para:
-            # Don't wrap headers, lists, or HTML tags in <p>
-            if not (para.startswith('<h') or para.startswith('<ol') or 
-                    para.startswith('<ul') or para.startswith('<li>') or
-                    para.startswith('</') or para.startswith('<div')):
-                # Check if it's a display math block
-                if para.startswith('$$') or para.endswith('$$'):
-                    formatted_paragraphs.append(para)
-                else:
-                    formatted_paragraphs.append(f'<p>{para}</p>')
-            else:
-                formatted_paragraphs.append(para)
-    
-    html = '\n'.join(formatted_paragraphs)
-    
-    return html
+# Optional fast path: mistune converts markdown in a single tokenize+render
+# pass instead of the dozen regex passes in the fallback below
+try:
+    import mistune
+except ImportError:
+    mistune = None
 
-def convert_notebook_to_html(notebook_path, output_path=None):
-    """
-    Convert a Jupyter notebook to HTML with embedded SageCells.
-    
-    Args:
-        notebook_path: Path to the input .ipynb file
-        output_path: Path to the output .html file (optional)
-    """
-    # Set default output path if not provided
-    if output_path is None:
-        output_path = notebook_path.replace('.ipynb', '.html')
-    
-    # Read the notebook
-    with open(notebook_path, 'r', encoding='utf-8') as f:
-        nb = nbformat.read(f, as_version=4)
-    
-    # Extract title from first markdown cell if available
-    title = "Lecture Notes"
-    if nb.cells and nb.cells[0].cell_type == 'markdown':
-        first_line = nb.cells[0].source.split('\n')[0]
-        if first_line.startswith('#'):
-            title = first_line.lstrip('#').strip()
-    
-    # Count sections (h1 and h2 headers) to determine how many linked groups we need
-    section_count = 0
-    for cell in nb.cells:
-        if cell.cell_type == 'markdown':
-            # Check if this cell contains h1 or h2 headers
-            if re.search(r'^#{1,2}\s+', cell.source, re.MULTILINE):
-                section_count += 1
-    
-    # Start HTML document
-    html = f"""<!DOCTYPE html>
+# Cache of generated HTML keyed by notebook content, so unchanged
+# notebooks are copied instead of reconverted. The key folds in this
+# script's own bytes (and the markdown backend) so editing the converter
+# invalidates old entries.
+_CACHE_DIR = '.cache'
+_CACHE_KEEP = 50
+
+with open(__file__, 'rb') as _f:
+    _CONVERTER_FINGERPRINT = hashlib.sha256(_f.read()).digest()
+if mistune is not None:
+    _CONVERTER_FINGERPRINT += mistune.__version__.encode('utf-8')
+
+def _cell_source(cell):
+    """Return a cell's source as one string (raw JSON stores a line list)."""
+    src = cell['source']
+    return src if isinstance(src, str) else ''.join(src)
+
+def _has_section_header(cell):
+    """Check a cell's source for an h1/h2 header without joining its lines."""
+    src = cell['source']
+    if isinstance(src, str):
+        return _H12_RE.search(src) is not None
+    return any(_H12_RE.search(line) for line in src)
+
+def _prune_cache():
+    """Drop all but the most recently used _CACHE_KEEP cache entries."""
+    cached = sorted(glob.glob(os.path.join(_CACHE_DIR, '*.html')),
+                    key=os.path.getmtime)
+    for stale in cached[:-_CACHE_KEEP]:
+        os.remove(stale)
+
+# Precompiled patterns used by markdown_to_html (avoids re-parsing on every cell)
+_HDR_RE = re.compile(r'^(#{1,6})\s+(.+)$', re.MULTILINE)
+# Single alternation for all inline markup. Math spans come first so
+# that asterisks, underscores and backticks inside $...$ or $$...$$ are
+# never touched, fixing e.g. $a_1$ being mangled into italics.
+_INLINE_RE = re.compile(
+    r'(?s:\$\$.*?\$\$)'
+    r'|\$[^$\n]+\$'
+    r'|\*\*(.+?)\*\*'
+    r'|\*(.+?)\*'
+    r'|\b_(.+?)_\b'
+    r'|`([^`]+)`'
+)
+
+def _inline_sub(m):
+    bold, ital, uscore_ital, code = m.group(1, 2, 3, 4)
+    if bold is not None:
+        return f'<strong>{bold}</strong>'
+    if ital is not None:
+        return f'<em>{ital}</em>'
+    if uscore_ital is not None:
+        return f'<em>{uscore_ital}</em>'
+    if code is not None:
+        return f'<code>{code}</code>'
+    return m.group(0)  # math span: pass through untouched
+
+_LIST_LINE_RE = re.compile(r'^(?:(\d+\.\s+)|([-*]\s+))(.*)$')
+_H12_RE = re.compile(r'^#{1,2}\s+', re.MULTILINE)
+_TRAIL_WS_RE = re.compile(r'[ \t]+\n')
+# Anything markdown_to_html could act on: markup characters, math,
+# list markers or multiple lines. Cells without any of these are plain
+# one-line prose and can skip every conversion pass.
+_SPECIAL_RE = re.compile(r'[#*_`$\n\-]|^\d+\.', re.MULTILINE)
+
+# Paragraphs opening with any of these are block-level markup that must
+# not be wrapped in <p>
+_BLOCK_PREFIXES = ('<h', '<ol', '<ul', '<li>', '</', '<div')
+
+# Per-cell templates, parsed once instead of rebuilt as f-strings in the
+# cell loop; filled via format_map to skip the kwargs dict copy
+_MD_TMPL = '<div class="markdown-cell">\n{html}\n</div>\n\n'
+_CODE_TMPL = '''<div class="sage-cell sage-section-{i}">
+<script type="text/x-sage">
+{src}
+</script>
+</div>
+
+'''
+# %-formatted: substituting a single int is cheaper than format_map and
+# the braces in the JS need no doubling
+_SAGECELL_TMPL = """        sagecell.makeSagecell({
+            inputLocation: '.sage-section-%d',
+            evalButtonText: 'Run',
+            languages: ['sage'],
+            hide: ['permalink'],
+            linked: true
+        });
+"""
+
+# The document head is identical across notebooks apart from the title,
+# so it lives in plain string constants (no f-string re-parsing, no
+# doubled braces around the CSS) and is written in three pieces around
+# the title and the makeSagecell block
+_HEAD_PRE = """<!DOCTYPE html>
 <html>
 <head>
     <meta charset="utf-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{title}</title>
-    <style> body \u007b margin: 60px;\u007d </style>
+    <title>"""
+
+_HEAD_MID = """</title>
+    <style> body { margin: 60px;} </style>
     <!-- Custom CSS -->
     <link rel="stylesheet" type="text/css" href="style.css">
     
@@ -140,19 +131,8 @@ def convert_notebook_to_html(notebook_path, output_path=None):
     <script>
         // Create separate linked groups for each section
 """
-    
-    # Add makeSagecell calls for each section
-    for i in range(section_count):
-        html += f"""        sagecell.makeSagecell({{
-            inputLocation: '.sage-section-{i}',
-            evalButtonText: 'Run',
-            languages: ['sage'],
-            hide: ['permalink'],
-            linked: true
-        }});
-"""
-    
-    html += """    </script>
+
+_HEAD_POST = """    </script>
     
     <!-- MathJax for TeX rendering -->
     <script src="https://polyfill.io/v3/polyfill.min.js?features=es6"></script>
@@ -192,56 +172,265 @@ def convert_notebook_to_html(notebook_path, output_path=None):
 </head>
 <body>
 """
+
+def _hdr_sub(m):
+    n = len(m.group(1))
+    return f'<h{n}>{m.group(2)}</h{n}>'
+
+if mistune is not None:
+    def _parse_inline_math(inline, m, state):
+        # Emit the whole match as an opaque token so MathJax delimiters
+        # and everything between them survive untouched
+        state.append_token({'type': 'inline_math', 'raw': m.group(0)})
+        return m.end()
+
+    def _math_plugin(md):
+        md.inline.register(
+            'inline_math',
+            r'\$\$(?:[^$]|\$(?!\$))+?\$\$|\$[^$\n]+?\$',
+            _parse_inline_math,
+            before='escape',
+        )
+        if md.renderer and md.renderer.NAME == 'html':
+            md.renderer.register('inline_math', lambda r, text: text)
+
+    class _SageCellRenderer(mistune.HTMLRenderer):
+        """HTML renderer matching the markup the site's style.css expects."""
+
+        def list(self, text, ordered, **attrs):
+            tag = 'ol' if ordered else 'ul'
+            return f'<{tag} class="indented-list">\n{text}</{tag}>\n'
+
+        def paragraph(self, text):
+            # Leave display math blocks unwrapped, as the fallback does
+            if text.startswith('$$') or text.endswith('$$'):
+                return text + '\n'
+            return super().paragraph(text)
+
+    _MD = mistune.create_markdown(renderer=_SageCellRenderer(escape=False),
+                                  plugins=[_math_plugin])
+else:
+    _MD = None
+
+def markdown_to_html(markdown_text):
+    """
+    Convert markdown to HTML while preserving LaTeX math.
+    Accepts either a single string or the list of line strings that raw
+    notebook JSON carries, joining the latter just once here.
+    Uses mistune when it is installed; otherwise falls back to a simple
+    regex converter that handles common markdown elements.
+    """
+    if not isinstance(markdown_text, str):
+        markdown_text = ''.join(markdown_text)
+
+    # Trivial cells: nothing any pass could convert, so just wrap in <p>
+    if not _SPECIAL_RE.search(markdown_text):
+        stripped = markdown_text.strip()
+        return f'<p>{stripped}</p>' if stripped else ''
+
+    if _MD is not None:
+        return _MD(markdown_text)
+
+    html = markdown_text
     
-    # Process each cell
-    current_section = -1  # Track which section we're in (-1 means before any section)
-    for cell in nb.cells:
-        if cell.cell_type == 'markdown':
-            # Check if this cell contains h1 or h2 headers
-            if re.search(r'^#{1,2}\s+', cell.source, re.MULTILINE):
-                current_section += 1
-            # Convert markdown to HTML manually, preserving LaTeX
-            html_content = markdown_to_html(cell.source)
-            html += f'<div class="markdown-cell">\n{html_content}\n</div>\n\n'
-        elif cell.cell_type == 'code':
-            # Assign sage cells to the current section
-            section_class = f'sage-section-{current_section}' if current_section >= 0 else 'sage-section-0'
-            # Create SageCell
-            html += f'''<div class="sage-cell {section_class}">
-<script type="text/x-sage">
-{cell.source}
-</script>
-</div>
+    # Convert headers (all six levels in one pass)
+    html = _HDR_RE.sub(_hdr_sub, html)
 
-'''
+    # Convert bold, italic (asterisk and underscore forms) and inline
+    # code in one scan, skipping LaTeX math spans entirely
+    html = _INLINE_RE.sub(_inline_sub, html)
+    
+    # Convert lists: classify each line with a single match against an
+    # ordered/unordered alternation, tracking state as 0=none, 1=ol, 2=ul
+    result_lines = []
+    append = result_lines.append
+    match = _LIST_LINE_RE.match
+    in_list = 0
+    for line in html.split('\n'):
+        m = match(line)
+        if m is None:
+            if in_list:
+                append('</ol>' if in_list == 1 else '</ul>')
+                in_list = 0
+            append(line)
+        elif m.group(1):
+            # Ordered list
+            if in_list != 1:
+                if in_list:
+                    append('</ul>')
+                append('<ol class="indented-list">')
+                in_list = 1
+            append(f'<li>{m.group(3)}</li>')
+        else:
+            # Unordered list
+            if in_list != 2:
+                if in_list:
+                    append('</ol>')
+                append('<ul class="indented-list">')
+                in_list = 2
+            append(f'<li>{m.group(3)}</li>')
+
+    if in_list:
+        append('</ol>' if in_list == 1 else '</ul>')
+
+    html = '\n'.join(result_lines)
     
-    # Add link back to lecture notes page
-    html += """
+    # Convert paragraphs (lines separated by blank lines)
+    # Normalize stray trailing whitespace once, then a plain C-level
+    # str.split on double newlines finds the breaks; blank-only chunks
+    # from runs of empty lines are dropped by the strip check below
+    html = _TRAIL_WS_RE.sub('\n', html)
+    paragraphs = html.split('\n\n')
+    formatted_paragraphs = []
+    append = formatted_paragraphs.append
+
+    for para in paragraphs:
+        para = para.strip()
+        if para:
+            # Don't wrap headers, lists, or HTML tags in <p>
+            if not para.startswith(_BLOCK_PREFIXES):
+                # Check if it's a display math block
+                if para.startswith('$$') or para.endswith('$$'):
+                    append(para)
+                else:
+                    append(f'<p>{para}</p>')
+            else:
+                append(para)
+    
+    html = '\n'.join(formatted_paragraphs)
+    
+    return html
+
+def convert_notebook_to_html(notebook_path, output_path=None):
+    """
+    Convert a Jupyter notebook to HTML with embedded SageCells.
+    
+    Args:
+        notebook_path: Path to the input .ipynb file
+        output_path: Path to the output .html file (optional)
+    """
+    # Set default output path if not provided
+    if output_path is None:
+        output_path = notebook_path.replace('.ipynb', '.html')
+    
+    # Read the notebook bytes and check the cache before doing any work
+    with open(notebook_path, 'rb') as f:
+        raw = f.read()
+    key = hashlib.sha256(raw + _CONVERTER_FINGERPRINT).hexdigest()
+    cache_path = os.path.join(_CACHE_DIR, f'{key}.html')
+    if os.path.exists(cache_path):
+        shutil.copyfile(cache_path, output_path)
+        os.utime(cache_path)  # refresh mtime so pruning keeps hot entries
+        print(f"Successfully converted {notebook_path} to {output_path} (cached)")
+        return output_path
+
+    # Parse the notebook JSON directly — the converter only reads each
+    # cell's type and source, so nbformat's schema validation and
+    # NotebookNode construction are pure overhead. Fall back to nbformat
+    # for notebooks that need version upgrading or repair.
+    try:
+        cells = json.loads(raw)['cells']
+    except (ValueError, KeyError):
+        # Deferred import: loading nbformat pulls in jsonschema and the
+        # validators, a noticeable startup cost the fast path never pays
+        import nbformat
+        cells = nbformat.reads(raw.decode('utf-8'), as_version=4)['cells']
+
+    # Extract title from first markdown cell if available
+    title = "Lecture Notes"
+    if cells and cells[0]['cell_type'] == 'markdown':
+        src = cells[0]['source']
+        first_line = (src if isinstance(src, str) else src[0] if src else '').split('\n')[0]
+        if first_line.startswith('#'):
+            title = first_line.lstrip('#').strip()
+
+    # Cheap pre-scan over just the markdown sources: the document head
+    # needs the section (h1/h2) count before anything can be written
+    section_count = sum(1 for cell in cells
+                        if cell['cell_type'] == 'markdown'
+                        and _has_section_header(cell))
+
+    # Stream chunks straight to disk as they are produced instead of
+    # building the whole page in memory. The file is opened in binary
+    # mode with a large buffer: chunks are encoded directly, skipping
+    # TextIOWrapper's incremental encoder, and a typical page flushes to
+    # the OS in a single write
+    with open(output_path, 'wb', buffering=1 << 20) as f:
+        def write(chunk, _raw_write=f.write):
+            _raw_write(chunk.encode('utf-8'))
+
+        # Start HTML document
+        write(_HEAD_PRE)
+        write(title)
+        write(_HEAD_MID)
+
+        # Add makeSagecell calls for each section
+        write(''.join(_SAGECELL_TMPL % i for i in range(section_count)))
+
+        write(_HEAD_POST)
+
+        # Process each cell
+        current_section = -1  # Track which section we're in (-1 means before any section)
+        for cell in cells:
+            if cell['cell_type'] == 'markdown':
+                # Check if this cell contains h1 or h2 headers
+                if _has_section_header(cell):
+                    current_section += 1
+                # Convert markdown to HTML manually, preserving LaTeX;
+                # the converter joins a line-list source itself
+                html_content = markdown_to_html(cell['source'])
+                write(_MD_TMPL.format_map({'html': html_content}))
+            elif cell['cell_type'] == 'code':
+                # Create a SageCell assigned to the current section
+                # (cells before any section land in section 0)
+                write(_CODE_TMPL.format_map({'i': max(current_section, 0),
+                                             'src': _cell_source(cell)}))
+
+        # Add link back to lecture notes page
+        write("""
 <hr style="margin-top: 40px; margin-bottom: 20px;">
 <p style="text-align: center;">
     <a href="lecture-notes.html" style="font-size: 1.1em;">← Back to Lecture Notes</a>
 </p>
 
 </body>
-</html>"""
-    
-    # Write output
-    with open(output_path, 'w', encoding='utf-8') as f:
-        f.write(html)
-    
+</html>""")
+
+    # Save a copy for next time and keep the cache bounded
+    os.makedirs(_CACHE_DIR, exist_ok=True)
+    shutil.copyfile(output_path, cache_path)
+    _prune_cache()
+
     print(f"Successfully converted {notebook_path} to {output_path}")
     return output_path
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
-        print("Usage: python convert_to_html.py <notebook.ipynb> [output.html]")
+        print("Usage: python convert_to_html.py <notebook.ipynb | directory | glob> [output.html]")
         sys.exit(1)
-    
+
     notebook_path = sys.argv[1]
-    output_path = sys.argv[2] if len(sys.argv) > 2 else None
-    
-    if not os.path.exists(notebook_path):
-        print(f"Error: File {notebook_path} not found")
-        sys.exit(1)
-    
-    convert_notebook_to_html(notebook_path, output_path)
+
+    # Batch mode: a directory or glob converts every matching notebook,
+    # in parallel since each conversion is independent
+    if os.path.isdir(notebook_path):
+        notebooks = sorted(glob.glob(os.path.join(notebook_path, '*.ipynb')))
+    elif any(c in notebook_path for c in '*?['):
+        notebooks = sorted(glob.glob(notebook_path))
+    else:
+        notebooks = None
+
+    if notebooks is not None:
+        if not notebooks:
+            print(f"Error: No notebooks match {notebook_path}")
+            sys.exit(1)
+        with ProcessPoolExecutor() as executor:
+            list(executor.map(convert_notebook_to_html, notebooks))
+    else:
+        output_path = sys.argv[2] if len(sys.argv) > 2 else None
+
+        if not os.path.exists(notebook_path):
+            print(f"Error: File {notebook_path} not found")
+            sys.exit(1)
+
+        convert_notebook_to_html(notebook_path, output_path)